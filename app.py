@@ -3,6 +3,7 @@ import sys
 import logging
 import asyncio
 from datetime import datetime
+from functools import lru_cache
 
 # إعداد logging أولاً
 logging.basicConfig(
@@ -28,13 +29,22 @@ except ImportError as e:
     logger.error(f"❌ خطأ في استيراد المكتبات: {e}")
     sys.exit(1)
 
+# الوحدات المحلية
+import diagnostics
+
 # تحميل متغيرات البيئة
 load_dotenv()
 
 # متغيرات
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
+# عدة توكنات مفصولة بفواصل لتشغيل عدة بوتات في عملية واحدة (multibot.py)
+BOT_TOKENS = [t.strip() for t in os.getenv('TELEGRAM_BOT_TOKENS', '').split(',') if t.strip()]
 PORT = int(os.environ.get('PORT', 10000))
 IMAGES_BASE_DIR = 'Images'
+# مهلة الانتقال للسؤال التالي (بالثواني)
+NEXT_QUESTION_DELAY = float(os.getenv('NEXT_QUESTION_DELAY', 1.5))
+# ملف تسجيل الجلسة (اختياري) لإعادة تشغيلها لاحقاً عبر replay.py
+RECORD_SESSION_FILE = os.getenv('RECORD_SESSION_FILE', '')
 
 # البيانات الثابتة من ملف Excel - تم تحديثها حسب الملف المرفق
 CORRECT_ANSWERS_DATA = {
@@ -84,8 +94,28 @@ def load_correct_answers():
     
     return correct_answers
 
+# فهرس مسارات الصور - مشترك بين جميع البوتات في نفس العملية
+_image_paths = {}
+image_cache_stats = {'hits': 0, 'misses': 0}
+
 def get_image_path(question_num):
-    """الحصول على مسار الصورة بناءً على رقم السؤال"""
+    """الحصول على مسار الصورة بناءً على رقم السؤال
+    
+    يتم حفظ المسارات الموجودة فقط، أما الصورة المفقودة فيُعاد البحث عنها في كل مرة
+    حتى تظهر الصورة المضافة لاحقاً بدون إعادة تشغيل
+    """
+    if question_num in _image_paths:
+        image_cache_stats['hits'] += 1
+        return _image_paths[question_num]
+    
+    image_cache_stats['misses'] += 1
+    path = find_image_path(question_num)
+    if path:
+        _image_paths[question_num] = path
+    return path
+
+def find_image_path(question_num):
+    """البحث عن صورة السؤال في مجلد الصور"""
     if 1 <= question_num <= 10:
         folder = "True or False"
     elif 11 <= question_num <= 20:
@@ -139,10 +169,50 @@ def get_image_path(question_num):
     
     return None
 
-# قاموس لحفظ إجابات المستخدمين
-user_sessions = {}
 correct_answers = load_correct_answers()
 
+@lru_cache(maxsize=None)
+def get_question_markup(question_num, question_type):
+    """بناء أزرار السؤال ونص نوعه (محفوظة ومشتركة بين البوتات)"""
+    if question_type == 'tf':
+        # أزرار صح/خطأ
+        keyboard = [
+            [
+                InlineKeyboardButton("✅ صح (True)", callback_data=f"ans_{question_num}_t"),
+                InlineKeyboardButton("❌ خطأ (False)", callback_data=f"ans_{question_num}_f")
+            ]
+        ]
+        question_type_text = "📝 **سؤال صح/خطأ**"
+    else:
+        # أزرار MCQ - أحرف إنجليزية A, B, C, D
+        keyboard = [
+            [
+                InlineKeyboardButton("A", callback_data=f"ans_{question_num}_a"),
+                InlineKeyboardButton("B", callback_data=f"ans_{question_num}_b"),
+                InlineKeyboardButton("C", callback_data=f"ans_{question_num}_c"),
+                InlineKeyboardButton("D", callback_data=f"ans_{question_num}_d")
+            ]
+        ]
+        question_type_text = "🔠 **سؤال اختيار من متعدد**"
+    
+    return InlineKeyboardMarkup(keyboard), question_type_text
+
+def get_user_sessions(context: ContextTypes.DEFAULT_TYPE):
+    """قاموس جلسات المستخدمين الخاص بهذا البوت"""
+    return context.bot_data.setdefault('user_sessions', {})
+
+def get_photo_file_ids(context: ContextTypes.DEFAULT_TYPE):
+    """file_id الصور المرفوعة مسبقاً - خاص بكل بوت لأن file_id لا يصلح لبوت آخر"""
+    return context.bot_data.setdefault('photo_file_ids', {})
+
+def get_bot_stats(context: ContextTypes.DEFAULT_TYPE):
+    """عدادات هذا البوت المعروضة في تشخيص /status"""
+    return context.bot_data.setdefault('stats', {
+        'photo_file_id_hits': 0,
+        'photo_file_id_misses': 0,
+        'missing_images': 0,
+    })
+
 # تعريف الدوال
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """بدء الاختبار"""
@@ -169,6 +239,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def begin_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """بدء إرسال الأسئلة"""
+    user_sessions = get_user_sessions(context)
     user_id = update.effective_user.id
     username = update.effective_user.username or update.effective_user.first_name
     
@@ -221,7 +292,7 @@ async def begin_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def send_question(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
     """إرسال سؤال للمستخدم"""
-    session = user_sessions[user_id]
+    session = get_user_sessions(context)[user_id]
     question_num = session['current_question']
     
     # التحقق من انتهاء الأسئلة
@@ -238,6 +309,7 @@ async def send_question(update: Update, context: ContextTypes.DEFAULT_TYPE, user
     
     if not image_path:
         logger.error(f"❌ لم أجد صورة للسؤال {question_num}")
+        get_bot_stats(context)['missing_images'] += 1
         
         # إرسال رسالة خطأ
         await context.bot.send_message(
@@ -249,52 +321,45 @@ async def send_question(update: Update, context: ContextTypes.DEFAULT_TYPE, user
         
         # الانتقال للسؤال التالي
         session['current_question'] += 1
-        await asyncio.sleep(1.5)
+        await asyncio.sleep(NEXT_QUESTION_DELAY)
         await send_question(update, context, user_id)
         return
     
     # تحديد نوع السؤال وبناء الأزرار
     question_data = session['answers'][question_num]
+    reply_markup, question_type_text = get_question_markup(question_num, question_data['type'])
     
-    if question_data['type'] == 'tf':
-        # أزرار صح/خطأ
-        keyboard = [
-            [
-                InlineKeyboardButton("✅ صح (True)", callback_data=f"ans_{question_num}_t"),
-                InlineKeyboardButton("❌ خطأ (False)", callback_data=f"ans_{question_num}_f")
-            ]
-        ]
-        question_type_text = "📝 **سؤال صح/خطأ**"
-    else:
-        # أزرار MCQ - أحرف إنجليزية A, B, C, D
-        keyboard = [
-            [
-                InlineKeyboardButton("A", callback_data=f"ans_{question_num}_a"),
-                InlineKeyboardButton("B", callback_data=f"ans_{question_num}_b"),
-                InlineKeyboardButton("C", callback_data=f"ans_{question_num}_c"),
-                InlineKeyboardButton("D", callback_data=f"ans_{question_num}_d")
-            ]
-        ]
-        question_type_text = "🔠 **سؤال اختيار من متعدد**"
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    file_ids = get_photo_file_ids(context)
+    stats = get_bot_stats(context)
     
     try:
+        # إعادة استخدام file_id إن كانت الصورة مرفوعة مسبقاً لهذا البوت
+        if question_num in file_ids:
+            stats['photo_file_id_hits'] += 1
+            photo = file_ids[question_num]
+        else:
+            stats['photo_file_id_misses'] += 1
+            with open(image_path, 'rb') as f:
+                photo = f.read()
+        
         # إرسال الصورة مع الأزرار
-        with open(image_path, 'rb') as photo:
-            message = await context.bot.send_photo(
-                chat_id=update.effective_chat.id if hasattr(update, 'message') else update.callback_query.message.chat.id,
-                photo=photo,
-                caption=f"**السؤال رقم: {question_num}**\n{question_type_text}\n\nاختر الإجابة الصحيحة:",
-                reply_markup=reply_markup,
-                parse_mode='Markdown'
-            )
-            
-            # حفظ معرف الرسالة (اختياري)
-            session['last_message_id'] = message.message_id
+        message = await context.bot.send_photo(
+            chat_id=update.effective_chat.id if hasattr(update, 'message') else update.callback_query.message.chat.id,
+            photo=photo,
+            caption=f"**السؤال رقم: {question_num}**\n{question_type_text}\n\nاختر الإجابة الصحيحة:",
+            reply_markup=reply_markup,
+            parse_mode='Markdown'
+        )
+        
+        # حفظ معرف الرسالة (اختياري)
+        session['last_message_id'] = message.message_id
+        
+        if message.photo:
+            file_ids[question_num] = message.photo[-1].file_id
             
     except Exception as e:
         logger.error(f"❌ خطأ في إرسال الصورة: {e}")
+        file_ids.pop(question_num, None)
         
         # إرسال رسالة نصية بديلة
         await context.bot.send_message(
@@ -314,6 +379,7 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     query = update.callback_query
     user_id = query.from_user.id
+    user_sessions = get_user_sessions(context)
     
     # الرد على callback query - هذا مهم جداً!
     try:
@@ -396,7 +462,7 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
         session['current_question'] += 1
         
         # انتظار قصير ثم إرسال السؤال التالي
-        await asyncio.sleep(1.5)
+        await asyncio.sleep(NEXT_QUESTION_DELAY)
         
         # تسجيل وقت بدء السؤال الجديد
         session['question_start_time'] = datetime.now()
@@ -421,6 +487,8 @@ async def handle_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_results(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int = None):
     """عرض النتائج"""
+    user_sessions = get_user_sessions(context)
+    
     if user_id is None:
         if hasattr(update, 'message'):
             user_id = update.effective_user.id
@@ -569,6 +637,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """عرض حالة البوت"""
     user_id = update.effective_user.id
+    user_sessions = get_user_sessions(context)
     
     status_text = (
         f"🔍 **حالة البوت**\n\n"
@@ -590,6 +659,23 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     status_text += "📊 لعرض النتائج: /results"
     
     await update.message.reply_text(status_text, parse_mode='Markdown')
+    
+    # تشخيص الأداء للمشرفين فقط
+    if diagnostics.is_admin(user_id):
+        markup_cache = get_question_markup.cache_info()
+        stats = get_bot_stats(context)
+        report = diagnostics.format_report(
+            sessions=user_sessions,
+            caches={
+                'فهرس الصور': (image_cache_stats['hits'], image_cache_stats['misses']),
+                'أزرار الأسئلة': (markup_cache.hits, markup_cache.misses),
+                'file_id الصور': (stats['photo_file_id_hits'], stats['photo_file_id_misses']),
+            },
+            counters={
+                'أسئلة بدون صورة (تم تخطيها)': stats['missing_images'],
+            },
+        )
+        await update.message.reply_text(report)
 
 async def test_button_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """اختبار الأزرار"""
@@ -617,12 +703,53 @@ async def handle_test_button(update: Update, context: ContextTypes.DEFAULT_TYPE)
         parse_mode='Markdown'
     )
 
+def register_handlers(application: Application):
+    """إضافة handlers الأوامر والأزرار للتطبيق"""
+    # إضافة handlers للأوامر
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("begin", begin_test))
+    application.add_handler(CommandHandler("results", results_command))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("status", status_command))
+    application.add_handler(CommandHandler("test", test_button_command))
+    application.add_handler(CommandHandler("profile", diagnostics.profile_command))
+    
+    # إضافة handlers للأزرار
+    application.add_handler(CallbackQueryHandler(handle_answer, pattern="^ans_"))
+    application.add_handler(CallbackQueryHandler(handle_test_button, pattern="^test_"))
+
+def build_application(token: str, request=None, recorder=None) -> Application:
+    """إنشاء التطبيق مع جميع الـ handlers
+    
+    request: كائن BaseRequest بديل (مثل محاكي Bot API في replay.py)
+    recorder: SessionRecorder لتسجيل التحديثات والاستدعاءات الصادرة
+    """
+    builder = (
+        Application.builder()
+        .token(token)
+        .post_init(diagnostics.monitor.start)
+        .post_shutdown(diagnostics.monitor.stop)
+    )
+    
+    if recorder is not None:
+        request = recorder.wrap_request(request)
+    if request is not None:
+        builder = builder.request(request)
+    
+    application = builder.build()
+    
+    if recorder is not None:
+        recorder.attach(application)
+    
+    register_handlers(application)
+    return application
+
 def main():
     """الدالة الرئيسية لتشغيل البوت"""
     logger.info("🚀 بدء تشغيل بوت الرياضيات...")
     
     # التحقق من التوكن
-    if not TOKEN:
+    if not TOKEN and not BOT_TOKENS:
         logger.error("❌ TOKEN غير موجود! تأكد من إعداد TELEGRAM_BOT_TOKEN")
         logger.info("💡 التعليمات:")
         logger.info("1. اذهب إلى Render Dashboard")
@@ -650,28 +777,37 @@ def main():
     else:
         logger.warning(f"⚠️ مجلد {IMAGES_BASE_DIR} غير موجود!")
     
-    # إنشاء التطبيق
-    application = Application.builder().token(TOKEN).build()
-    
-    # إضافة handlers للأوامر
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("begin", begin_test))
-    application.add_handler(CommandHandler("results", results_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("status", status_command))
-    application.add_handler(CommandHandler("test", test_button_command))
-    
-    # إضافة handlers للأزرار
-    application.add_handler(CallbackQueryHandler(handle_answer, pattern="^ans_"))
-    application.add_handler(CallbackQueryHandler(handle_test_button, pattern="^test_"))
-    
     # التحقق إذا كان على Render
     is_render = os.getenv('RENDER', '').lower() in ['true', '1', 'yes']
+    render_service_name = os.getenv('RENDER_SERVICE_NAME', 'math-limits-bot2')
+    
+    # عدة بوتات في عملية واحدة
+    tokens = list(dict.fromkeys(BOT_TOKENS + ([TOKEN] if TOKEN else [])))
+    if len(tokens) > 1:
+        import multibot
+        webhook_base_url = f"https://{render_service_name}.onrender.com" if is_render else None
+        asyncio.run(multibot.run(
+            tokens,
+            build_application,
+            port=PORT,
+            webhook_base_url=webhook_base_url,
+            record_path=RECORD_SESSION_FILE or None
+        ))
+        return
+    token = tokens[0]
+    
+    # إنشاء التطبيق
+    recorder = None
+    if RECORD_SESSION_FILE:
+        from recorder import SessionRecorder
+        recorder = SessionRecorder(RECORD_SESSION_FILE)
+        logger.info(f"🎙️ تسجيل الجلسة في: {RECORD_SESSION_FILE}")
+    
+    application = build_application(token, recorder=recorder)
     
     if is_render:
         # على Render - استخدام webhook
-        render_service_name = os.getenv('RENDER_SERVICE_NAME', 'math-limits-bot2')
-        webhook_url = f"https://{render_service_name}.onrender.com/{TOKEN}"
+        webhook_url = f"https://{render_service_name}.onrender.com/{token}"
         
         logger.info(f"🌐 استخدام webhook على Render")
         logger.info(f"📡 Webhook URL: {webhook_url}")
@@ -680,7 +816,7 @@ def main():
         application.run_webhook(
             listen="0.0.0.0",
             port=PORT,
-            url_path=TOKEN,
+            url_path=token,
             webhook_url=webhook_url,
             drop_pending_updates=True
         )
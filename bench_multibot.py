@@ -0,0 +1,99 @@
+"""مقارنة استهلاك الذاكرة (RSS): N بوت في عملية واحدة مقابل N عملية منفصلة
+
+الاستخدام:
+    python bench_multibot.py --bots 10
+
+كل بوت يعمل مقابل محاكي Bot API المحلي (replay.StubBotRequest) ويجيب على اختبار
+كامل حتى تمتلئ الجلسات والذاكرة المؤقتة قبل القياس.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import subprocess
+
+from telegram import Update
+
+import app
+import multibot
+from diagnostics import rss_bytes
+from replay import StubBotRequest
+
+app.NEXT_QUESTION_DELAY = 0
+
+
+def quiz_updates(user_id: int):
+    """تحديثات اختبار كامل لمستخدم واحد"""
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'Bench'}
+    chat = {'id': user_id, 'type': 'private'}
+    yield {'update_id': 1, 'message': {
+        'message_id': 1, 'date': int(time.time()), 'chat': chat, 'from': user, 'text': '/begin',
+        'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+    }}
+    for q_num in app.correct_answers:
+        yield {'update_id': 1 + q_num, 'callback_query': {
+            'id': str(q_num), 'from': user, 'chat_instance': 'bench', 'data': f'ans_{q_num}_t',
+            'message': {'message_id': 1 + q_num, 'date': int(time.time()), 'chat': chat},
+        }}
+
+
+async def run_bots(count: int) -> int:
+    """تشغيل count بوت في هذه العملية وإرجاع RSS"""
+    tokens = [f"{100000 + i}:bench" for i in range(count)]
+    applications = multibot.build_applications(tokens, app.build_application, request=StubBotRequest())
+
+    for application in applications.values():
+        await application.initialize()
+        await application.start()
+
+    for application in applications.values():
+        for data in quiz_updates(user_id=42):
+            await application.process_update(Update.de_json(data, application.bot))
+
+    rss = rss_bytes()
+
+    for application in applications.values():
+        await application.stop()
+        await application.shutdown()
+
+    return rss
+
+
+def spawn(count: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--child', str(count)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="مقارنة RSS لعدة بوتات في عملية واحدة مقابل عمليات منفصلة")
+    parser.add_argument('--bots', type=int, default=10, help="عدد البوتات")
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(asyncio.run(run_bots(args.child)))
+        return
+
+    single = spawn(args.bots)
+    one_process = int(single.communicate()[0])
+
+    children = [spawn(1) for _ in range(args.bots)]
+    per_process = [int(child.communicate()[0]) for child in children]
+    many_processes = sum(per_process)
+
+    mib = 1024 * 1024
+    print(f"🤖 عدد البوتات: {args.bots}")
+    print(f"• عملية واحدة:   {one_process / mib:8.1f} MiB")
+    print(f"• {args.bots} عملية منفصلة: {many_processes / mib:8.1f} MiB "
+          f"({many_processes / mib / args.bots:.1f} MiB لكل عملية)")
+    print(f"• التوفير:       {(many_processes - one_process) / mib:8.1f} MiB "
+          f"({many_processes / max(one_process, 1):.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""تشخيص صحة البوت أثناء التشغيل (للمشرفين فقط)
+
+- عينات لتأخر حلقة الأحداث (event-loop lag) كل LAG_SAMPLE_INTERVAL ثانية
+- عدد المهام المعلقة واستهلاك الذاكرة RSS
+- أعلى مواقع حجز الذاكرة عبر tracemalloc (عند ضبط TRACEMALLOC_FRAMES)
+- ملف CPU profile عند الطلب عبر /profile [ثواني]
+
+يتم تحديد المشرفين عبر ADMIN_IDS (أرقام مستخدمين مفصولة بفواصل).
+"""
+import os
+import sys
+import time
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import tempfile
+import tracemalloc
+from collections import deque
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+
+logger = logging.getLogger(__name__)
+
+ADMIN_IDS = {int(i) for i in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if i.isdigit()}
+LAG_SAMPLE_INTERVAL = float(os.getenv('LAG_SAMPLE_INTERVAL', 1.0))
+# 0 = tracemalloc معطل (له تكلفة على كل عملية حجز ذاكرة)
+TRACEMALLOC_FRAMES = int(os.getenv('TRACEMALLOC_FRAMES', 0))
+TRACEMALLOC_TOP = int(os.getenv('TRACEMALLOC_TOP', 5))
+PROFILE_SECONDS = int(os.getenv('PROFILE_SECONDS', 30))
+PROFILE_MAX_SECONDS = 300
+PROFILE_DIR = os.getenv('PROFILE_DIR', tempfile.gettempdir())
+
+
+def is_admin(user_id: int) -> bool:
+    return user_id in ADMIN_IDS
+
+
+def rss_bytes() -> int:
+    """الذاكرة المستخدمة حالياً للعملية (RSS)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class LoopMonitor:
+    """مهمة خلفية واحدة لكل عملية تقيس تأخر حلقة الأحداث
+
+    تتشاركها جميع البوتات في نفس العملية: تبدأ مع أول بوت وتتوقف مع آخر بوت.
+    """
+
+    def __init__(self, interval: float = LAG_SAMPLE_INTERVAL, window: int = 60):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self._task = None
+        self._users = 0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    async def start(self, application: Application = None):
+        self._users += 1
+        if self._task is None:
+            if TRACEMALLOC_FRAMES > 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, application: Application = None):
+        self._users -= 1
+        if self._users <= 0 and self._task is not None:
+            self._users = 0
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def lag_summary(self) -> str:
+        if not self.samples:
+            return "لا توجد عينات بعد"
+        values = [s * 1000 for s in self.samples]
+        return (
+            f"آخر {values[-1]:.1f}ms | متوسط {sum(values) / len(values):.1f}ms | "
+            f"أقصى {max(values):.1f}ms ({len(values)} عينة)"
+        )
+
+
+monitor = LoopMonitor()
+
+
+def tracemalloc_top(limit: int = TRACEMALLOC_TOP):
+    """أعلى مواقع حجز الذاكرة حسب الحجم"""
+    if not tracemalloc.is_tracing():
+        return None
+    stats = tracemalloc.take_snapshot().statistics('lineno')[:limit]
+    lines = []
+    for stat in stats:
+        frame = stat.traceback[0]
+        lines.append(f"{os.path.basename(frame.filename)}:{frame.lineno} - {stat.size / 1024:.1f} KiB ({stat.count})")
+    return lines
+
+
+def hit_rate(hits: int, misses: int) -> str:
+    total = hits + misses
+    rate = (hits / total) * 100 if total else 0
+    return f"{hits}/{total} ({rate:.0f}%)"
+
+
+def format_report(sessions: dict, caches: dict, counters: dict) -> str:
+    """نص تقرير التشخيص (بدون Markdown لأن مسارات الملفات تحتوي على _)
+
+    caches: اسم -> (hits, misses)
+    counters: اسم -> قيمة
+    """
+    in_progress = sum(1 for s in sessions.values() if not s.get('completed'))
+
+    lines = [
+        "🩺 تشخيص الأداء",
+        "",
+        f"• ⏱️ تأخر حلقة الأحداث: {monitor.lag_summary()}",
+        f"• 🧵 المهام المعلقة: {len(asyncio.all_tasks())}",
+        f"• 💾 الذاكرة RSS: {rss_bytes() / (1024 * 1024):.1f} MiB",
+        f"• 👥 الجلسات: قيد التقدم {in_progress} | مكتملة {len(sessions) - in_progress}",
+        "",
+        "🗃️ الذاكرة المؤقتة (hits/total):",
+    ]
+    for name, (hits, misses) in caches.items():
+        lines.append(f"• {name}: {hit_rate(hits, misses)}")
+
+    if counters:
+        lines.append("")
+        for name, value in counters.items():
+            lines.append(f"• {name}: {value}")
+
+    top = tracemalloc_top()
+    lines.append("")
+    if top is None:
+        lines.append("🔬 tracemalloc: معطل (TRACEMALLOC_FRAMES=0)")
+    else:
+        lines.append(f"🔬 tracemalloc أعلى {len(top)}:")
+        lines.extend(f"• {line}" for line in top)
+
+    return "\n".join(lines)
+
+
+_profiling = False
+
+
+async def run_profile(context: ContextTypes.DEFAULT_TYPE, chat_id: int, seconds: int):
+    """تشغيل cProfile لمدة seconds ثم إرسال الملخص والملف"""
+    global _profiling
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.disable()
+        _profiling = False
+
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats('cumulative').print_stats(15)
+    # حد رسالة تيليجرام 4096 حرف - يتم قص النهاية للحفاظ على رأس الجدول
+    summary = out.getvalue().strip()[:3500]
+
+    await context.bot.send_message(chat_id=chat_id, text=f"🔬 CPU profile ({seconds}s)\n\n{summary}")
+
+    # الملف مؤقت ويُحذف بعد إرساله حتى لا تتراكم الملفات
+    with tempfile.NamedTemporaryFile(prefix='profile-', suffix='.prof', dir=PROFILE_DIR, delete=False) as f:
+        path = f.name
+    try:
+        profiler.dump_stats(path)
+        with open(path, 'rb') as f:
+            await context.bot.send_document(
+                chat_id=chat_id,
+                document=f,
+                filename=f"profile-{time.strftime('%Y%m%d-%H%M%S')}.prof",
+            )
+    finally:
+        os.remove(path)
+
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile [ثواني] - CPU profile لمدة محددة (للمشرفين فقط)"""
+    global _profiling
+    if not is_admin(update.effective_user.id):
+        return
+
+    if _profiling:
+        await update.message.reply_text("⚠️ يوجد profile قيد التشغيل بالفعل")
+        return
+
+    try:
+        seconds = int(context.args[0]) if context.args else PROFILE_SECONDS
+    except ValueError:
+        seconds = PROFILE_SECONDS
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+
+    # قبل أول await حتى لا يمر أمران متزامنان من الفحص السابق (concurrent_updates)
+    _profiling = True
+    try:
+        await update.message.reply_text(f"🔬 جاري تسجيل CPU profile لمدة {seconds} ثانية...")
+    except Exception:
+        _profiling = False
+        raise
+
+    # في مهمة خلفية حتى لا يتوقف استقبال التحديثات أثناء القياس
+    context.application.create_task(run_profile(context, update.effective_chat.id, seconds), update=update)
@@ -0,0 +1,246 @@
+"""تشغيل عدة بوتات اختبار في عملية واحدة
+
+يتم تفعيله من app.py عند وضع أكثر من توكن في TELEGRAM_BOT_TOKENS (مفصولة بفواصل).
+كل توكن يحصل على Application خاص به (جلسات و file_id خاصة)، بينما تتم مشاركة
+بنك الأسئلة وفهرس الصور والأزرار ومجمع اتصالات HTTP بين جميع البوتات.
+على Render يتم استقبال التحديثات عبر خادم webhook واحد يوجه كل طلب حسب المسار /<TOKEN>.
+عند ضبط RECORD_SESSION_FILE يتم تسجيل كل بوت في ملف خاص به (session.<bot_id>.jsonl).
+"""
+import os
+import json
+import signal
+import secrets
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest, HTTPXRequest, RequestData
+
+from recorder import SessionRecorder
+
+logger = logging.getLogger(__name__)
+
+
+class SharedPool:
+    """كائن طلبات واحد (مجمع اتصالات) تتشاركه عدة بوتات مع عدد البوتات المستخدمة له"""
+
+    def __init__(self, inner: BaseRequest):
+        self.inner = inner
+        self.users = 0
+
+
+class SharedRequest(BaseRequest):
+    """حصة بوت واحد من SharedPool
+
+    كل بوت له SharedRequest خاص يتذكر إن كان قد حجز المجمع، فيكون shutdown آمناً
+    للتكرار ولا يُغلق الاتصال إلا عند إيقاف آخر بوت.
+    """
+
+    def __init__(self, pool: SharedPool):
+        self._pool = pool
+        self._inner = pool.inner
+        self._initialized = False
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self._inner.read_timeout
+
+    async def initialize(self) -> None:
+        if self._initialized:
+            return
+        if self._pool.users == 0:
+            await self._inner.initialize()
+        self._pool.users += 1
+        self._initialized = True
+
+    async def shutdown(self) -> None:
+        if not self._initialized:
+            return
+        self._initialized = False
+        self._pool.users -= 1
+        if self._pool.users == 0:
+            await self._inner.shutdown()
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        return await self._inner.do_request(
+            url,
+            method,
+            request_data=request_data,
+            read_timeout=read_timeout,
+            write_timeout=write_timeout,
+            connect_timeout=connect_timeout,
+            pool_timeout=pool_timeout,
+        )
+
+
+def bot_id(token: str) -> str:
+    """الجزء العام من التوكن (رقم البوت) - آمن للاستخدام في السجلات وأسماء الملفات"""
+    return token.split(':', 1)[0]
+
+
+def record_path_for(record_path: str, token: str) -> str:
+    """ملف تسجيل خاص بكل بوت: session.jsonl -> session.<bot_id>.jsonl"""
+    root, ext = os.path.splitext(record_path)
+    return f"{root}.{bot_id(token)}{ext}"
+
+
+def build_applications(
+    tokens: List[str],
+    build_application: Callable[..., Application],
+    request: Optional[BaseRequest] = None,
+    record_path: Optional[str] = None,
+) -> Dict[str, Application]:
+    """إنشاء Application لكل توكن مع مشاركة كائن الطلبات
+
+    build_application يُمرر من app.py بدلاً من استيراده هنا، لأن app.py يعمل كـ __main__
+    واستيراده مرة أخرى ينشئ نسخة ثانية من الوحدة وذاكرتها المؤقتة.
+    """
+    if request is None:
+        request = HTTPXRequest(connection_pool_size=max(8, 4 * len(tokens)))
+    pool = SharedPool(request)
+
+    applications = {}
+    for token in tokens:
+        recorder = SessionRecorder(record_path_for(record_path, token)) if record_path else None
+        applications[token] = build_application(token, request=SharedRequest(pool), recorder=recorder)
+    return applications
+
+
+def make_webhook_server(applications: Dict[str, Application], secret_tokens: Optional[Dict[str, str]] = None):
+    """خادم tornado واحد يوجه التحديثات للبوت المناسب حسب المسار
+
+    secret_tokens: توكن -> القيمة المرسلة لـ set_webhook، ويتم التحقق منها في
+    ترويسة X-Telegram-Bot-Api-Secret-Token لكل طلب
+    """
+    import tornado.web
+
+    secret_tokens = secret_tokens or {}
+
+    class UpdateHandler(tornado.web.RequestHandler):
+        async def post(self, path):
+            application = applications.get(path)
+            if application is None:
+                self.set_status(404)
+                return
+
+            secret_token = secret_tokens.get(path)
+            if secret_token and self.request.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret_token:
+                logger.warning(f"⚠️ طلب webhook بدون secret token صحيح للبوت {bot_id(path)}")
+                self.set_status(403)
+                return
+
+            try:
+                update = Update.de_json(json.loads(self.request.body), application.bot)
+            except Exception as e:
+                logger.warning(f"⚠️ تحديث غير صالح وصل للـ webhook: {e}")
+                update = None
+
+            # de_json يرجع None لـ {} و [] و null
+            if update is None:
+                self.set_status(400)
+                return
+
+            await application.update_queue.put(update)
+            self.set_status(200)
+
+    return tornado.web.Application([(r"/([^/]+)", UpdateHandler)])
+
+
+async def start_bot(application: Application, token: str, webhook_base_url: Optional[str], secret_token: Optional[str]):
+    """تشغيل بوت واحد (webhook أو polling)"""
+    await application.initialize()
+    if webhook_base_url:
+        await application.bot.set_webhook(
+            f"{webhook_base_url}/{token}",
+            drop_pending_updates=True,
+            secret_token=secret_token,
+        )
+    else:
+        await application.updater.start_polling(drop_pending_updates=True, allowed_updates=Update.ALL_TYPES)
+    await application.start()
+    if application.post_init:
+        await application.post_init(application)
+
+
+async def stop_bot(application: Application, started: bool = True):
+    """إيقاف بوت واحد - يتحمل البوتات التي فشل تشغيلها في منتصف الطريق"""
+    try:
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        if started and application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()
+        # إذا فشل initialize (مثل رفض التوكن في getMe) لا يستدعي shutdown السابق
+        # bot.shutdown، فيتم تحرير حصة البوت من المجمع وإغلاق ملف التسجيل هنا مباشرة
+        await application.bot.request.shutdown()
+    except Exception as e:
+        logger.error(f"❌ خطأ في إيقاف البوت: {e}")
+
+
+async def run(
+    tokens: List[str],
+    build_application: Callable[..., Application],
+    port: int,
+    webhook_base_url: Optional[str] = None,
+    record_path: Optional[str] = None,
+):
+    """تشغيل جميع البوتات حتى استلام إشارة الإيقاف
+
+    البوت الذي يفشل تشغيله (مثل توكن ملغي) يتم تخطيه دون إيقاف بقية البوتات.
+    """
+    applications = build_applications(tokens, build_application, record_path=record_path)
+    logger.info(f"🤖 تشغيل {len(applications)} بوت في عملية واحدة")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    server = None
+    running = {}
+    secret_tokens = {token: secrets.token_urlsafe(32) for token in applications} if webhook_base_url else {}
+
+    try:
+        for token, application in applications.items():
+            try:
+                await start_bot(application, token, webhook_base_url, secret_tokens.get(token))
+            except Exception as e:
+                # رسالة InvalidToken تحتوي على التوكن كاملاً
+                reason = str(e).replace(token, bot_id(token))
+                logger.error(f"❌ تعذر تشغيل البوت {bot_id(token)}، سيتم تخطيه: {type(e).__name__}: {reason}")
+                await stop_bot(application, started=False)
+                continue
+            running[token] = application
+            logger.info(f"✅ البوت @{application.bot.username} يعمل")
+
+        if not running:
+            logger.error("❌ لم يتم تشغيل أي بوت")
+            return
+
+        if webhook_base_url:
+            server = make_webhook_server(running, secret_tokens).listen(port, address="0.0.0.0")
+            logger.info(f"🌐 خادم webhook واحد على المنفذ {port}")
+
+        await stop_event.wait()
+    finally:
+        logger.info("🛑 إيقاف البوتات...")
+        if server is not None:
+            server.stop()
+        for application in running.values():
+            await stop_bot(application)
@@ -0,0 +1,133 @@
+import json
+import time
+import logging
+from typing import Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+from telegram.request import BaseRequest, HTTPXRequest, RequestData
+
+logger = logging.getLogger(__name__)
+
+# استدعاءات إدارة الـ webhook تحتوي على التوكن (في url) و secret_token - لا يتم تسجيلها
+UNRECORDED_METHODS = {'setWebhook', 'deleteWebhook', 'logOut', 'close'}
+
+# صيغة السجل: سطر JSON مضغوط لكل حدث (append-only)
+#   {"t": وقت, "kind": "start"}  - عند كل تشغيل للبوت، لأن الملف يُفتح للإضافة عبر إعادة التشغيل
+#   {"t": وقت, "kind": "update", "data": {...}}
+#   {"t": وقت, "kind": "call", "method": "sendPhoto", "params": {...}, "status": 200, "payload": "..."}
+#   {"t": وقت, "kind": "call", "method": "sendPhoto", "params": {...}, "error": {"type": "TimedOut", "message": "..."}}
+
+
+def endpoint_from_url(url: str) -> str:
+    """استخراج اسم دالة Bot API من الرابط (بدون التوكن)"""
+    return url.rsplit('/', 1)[-1]
+
+
+class SessionRecorder:
+    """تسجيل التحديثات الواردة واستدعاءات Bot API الصادرة في ملف JSONL"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self.write('start')
+
+    def write(self, kind: str, **fields):
+        """كتابة حدث واحد في السجل"""
+        event = {'t': round(time.time(), 4), 'kind': kind}
+        event.update(fields)
+        try:
+            self._file.write(json.dumps(event, ensure_ascii=False, separators=(',', ':'), default=str) + '\n')
+            self._file.flush()
+        except Exception as e:
+            logger.error(f"❌ خطأ في كتابة سجل الجلسة: {e}")
+
+    def close(self):
+        """إغلاق ملف السجل"""
+        if not self._file.closed:
+            self._file.close()
+
+    def wrap_request(self, request: Optional[BaseRequest] = None) -> 'RecordingRequest':
+        """تغليف كائن الطلبات لتسجيل الاستدعاءات الصادرة"""
+        # نفس حجم مجمع الاتصالات الافتراضي في ApplicationBuilder حتى لا يتغير سلوك الإنتاج
+        return RecordingRequest(request or HTTPXRequest(connection_pool_size=256), self)
+
+    def attach(self, application: Application):
+        """إضافة handler في المجموعة -1 لتسجيل كل تحديث قبل معالجته"""
+
+        async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            self.write('update', data=update.to_dict())
+
+        application.add_handler(TypeHandler(Update, record_update), group=-1)
+
+
+class RecordingRequest(BaseRequest):
+    """BaseRequest يمرر الطلبات لكائن آخر ويسجل كل استدعاء ورده"""
+
+    def __init__(self, inner: BaseRequest, recorder: SessionRecorder):
+        self._inner = inner
+        self._recorder = recorder
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self._inner.read_timeout
+
+    async def initialize(self) -> None:
+        await self._inner.initialize()
+
+    async def shutdown(self) -> None:
+        await self._inner.shutdown()
+        self._recorder.close()
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        endpoint = endpoint_from_url(url)
+        if endpoint in UNRECORDED_METHODS:
+            return await self._inner.do_request(
+                url,
+                method,
+                request_data=request_data,
+                read_timeout=read_timeout,
+                write_timeout=write_timeout,
+                connect_timeout=connect_timeout,
+                pool_timeout=pool_timeout,
+            )
+
+        params = request_data.parameters if request_data else {}
+
+        # تسجيل الرد كما هو (حتى ردود الخطأ) والاستثناءات مثل TimedOut حتى تتم إعادتها بنفس المسار
+        try:
+            status, payload = await self._inner.do_request(
+                url,
+                method,
+                request_data=request_data,
+                read_timeout=read_timeout,
+                write_timeout=write_timeout,
+                connect_timeout=connect_timeout,
+                pool_timeout=pool_timeout,
+            )
+        except Exception as e:
+            self._recorder.write(
+                'call',
+                method=endpoint,
+                params=params,
+                error={'type': type(e).__name__, 'message': str(e)},
+            )
+            raise
+
+        self._recorder.write(
+            'call',
+            method=endpoint,
+            params=params,
+            status=status,
+            payload=payload.decode('utf-8', 'replace'),
+        )
+        return status, payload
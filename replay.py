@@ -0,0 +1,252 @@
+"""إعادة تشغيل جلسة مسجلة (RECORD_SESSION_FILE) عبر handlers البوت
+
+الاستخدام:
+    python replay.py session.jsonl [--speed original|fast] [--ignore-param text]
+
+يتم تمرير التحديثات المسجلة للتطبيق بالترتيب مقابل محاكي محلي لـ Bot API،
+ثم تتم مقارنة الاستدعاءات الصادرة مع المسجلة وعرض أزمنة كل handler.
+"""
+import re
+import sys
+import json
+import time
+import asyncio
+import difflib
+import logging
+import argparse
+from collections import defaultdict, deque
+from typing import Optional, Tuple
+
+import telegram.error
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest, RequestData
+
+import app
+from recorder import endpoint_from_url
+
+logger = logging.getLogger(__name__)
+
+REPLAY_TOKEN = '123456:replay'
+
+# استدعاءات خاصة بالتشغيل وليست بمنطق البوت - لا تدخل في المقارنة
+IGNORED_METHODS = {'getMe', 'getUpdates', 'setWebhook', 'deleteWebhook', 'close', 'logOut'}
+
+# أقصى انتظار بين تحديثين في وضع original (مثل فترات توقف البوت بين تشغيلين)
+MAX_REPLAY_GAP = 60.0
+
+# قيم تعتمد على وقت التشغيل: التاريخ، الساعة (وقت البدء) والمدة المستغرقة في النتائج
+VOLATILE_PATTERNS = [
+    (re.compile(r'\b\d{4}-\d{2}-\d{2}\b'), '<date>'),
+    (re.compile(r'\b\d{2}:\d{2}:\d{2}\b'), '<time>'),
+    (re.compile(r'\d+ دقيقة و\d+ ثانية'), '<duration>'),
+]
+
+
+def load_session(path: str):
+    """قراءة ملف الجلسة وإرجاع (الأحداث, الاستدعاءات)
+
+    الأحداث هي التحديثات وعلامات start التي تفصل بين مرات تشغيل البوت.
+    """
+    events, calls = [], []
+    with open(path, encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                logger.warning(f"⚠️ سطر غير صالح في السجل: {line_num}")
+                continue
+            if event.get('kind') in ('start', 'update'):
+                events.append(event)
+            elif event.get('kind') == 'call':
+                calls.append(event)
+    return events, calls
+
+
+class StubBotRequest(BaseRequest):
+    """محاكي محلي لـ Bot API: يرد بالردود المسجلة أو بردود مصطنعة
+
+    لكل دالة يتم إرجاع الردود المسجلة بنفس الترتيب، بما فيها ردود الخطأ (مثل 400)
+    والاستثناءات (مثل TimedOut)، حتى تسلك الـ handlers نفس المسار الذي سلكته في الإنتاج.
+    """
+
+    def __init__(self, recorded_calls=None):
+        self._responses = defaultdict(deque)
+        for call in recorded_calls or []:
+            self._responses[call['method']].append(call)
+        self._message_id = 0
+        self.calls = []
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _fake_result(self, endpoint: str, params: dict):
+        """بناء رد مصطنع عند عدم وجود رد مسجل"""
+        if endpoint == 'getMe':
+            return {'id': 123456, 'is_bot': True, 'first_name': 'Replay', 'username': 'replay_bot'}
+        if endpoint.startswith(('send', 'edit', 'copy', 'forward')):
+            self._message_id += 1
+            chat_id = params.get('chat_id', 0)
+            message = {
+                'message_id': params.get('message_id', self._message_id),
+                'date': int(time.time()),
+                'chat': {'id': chat_id if isinstance(chat_id, int) else 0, 'type': 'private'},
+            }
+            if endpoint == 'sendPhoto':
+                file_id = params.get('photo') or f"stub-photo-{self._message_id}"
+                message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 1, 'height': 1}]
+            return message
+        return True
+
+    @staticmethod
+    def _recorded_error(error: dict) -> Exception:
+        """إعادة بناء الاستثناء المسجل (مثل TimedOut أو NetworkError)"""
+        cls = getattr(telegram.error, error.get('type', ''), None)
+        if isinstance(cls, type) and issubclass(cls, telegram.error.NetworkError):
+            return cls(error.get('message'))
+        return telegram.error.NetworkError(f"{error.get('type')}: {error.get('message')}")
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=BaseRequest.DEFAULT_NONE,
+        write_timeout=BaseRequest.DEFAULT_NONE,
+        connect_timeout=BaseRequest.DEFAULT_NONE,
+        pool_timeout=BaseRequest.DEFAULT_NONE,
+    ) -> Tuple[int, bytes]:
+        endpoint = endpoint_from_url(url)
+        params = request_data.parameters if request_data else {}
+        self.calls.append({'method': endpoint, 'params': params})
+
+        if self._responses[endpoint]:
+            recorded = self._responses[endpoint].popleft()
+            if 'error' in recorded:
+                raise self._recorded_error(recorded['error'])
+            return recorded['status'], recorded['payload'].encode('utf-8')
+
+        result = self._fake_result(endpoint, params)
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+
+def instrument_handlers(application: Application):
+    """تغليف callback كل handler لقياس زمن تنفيذه"""
+    timings = defaultdict(list)
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            callback = handler.callback
+
+            async def timed(update, context, _callback=callback, _name=callback.__name__):
+                started = time.perf_counter()
+                try:
+                    return await _callback(update, context)
+                finally:
+                    timings[_name].append(time.perf_counter() - started)
+
+            handler.callback = timed
+
+    return timings
+
+
+def normalize_call(call: dict, ignore_params=()) -> str:
+    """تحويل الاستدعاء لسطر نصي ثابت صالح للمقارنة"""
+    params = {k: v for k, v in call.get('params', {}).items() if k not in ignore_params}
+    line = f"{call['method']} {json.dumps(params, ensure_ascii=False, sort_keys=True, default=str)}"
+    for pattern, placeholder in VOLATILE_PATTERNS:
+        line = pattern.sub(placeholder, line)
+    return line
+
+
+def diff_calls(recorded, replayed, ignore_params=()):
+    """مقارنة الاستدعاءات الصادرة المسجلة مع المعاد تشغيلها"""
+    before = [normalize_call(c, ignore_params) for c in recorded if c['method'] not in IGNORED_METHODS]
+    after = [normalize_call(c, ignore_params) for c in replayed if c['method'] not in IGNORED_METHODS]
+    return list(difflib.unified_diff(before, after, 'recorded', 'replayed', lineterm=''))
+
+
+async def replay_session(path: str, speed: str = 'fast', ignore_params=()):
+    """إعادة تشغيل الجلسة وإرجاع (الفروقات, الأزمنة)"""
+    events, recorded_calls = load_session(path)
+    updates_count = sum(1 for e in events if e['kind'] == 'update')
+    runs_count = sum(1 for e in events if e['kind'] == 'start')
+    logger.info(f"📼 الجلسة: {runs_count} تشغيل، {updates_count} تحديث، {len(recorded_calls)} استدعاء")
+
+    if speed == 'fast':
+        app.NEXT_QUESTION_DELAY = 0
+
+    request = StubBotRequest(recorded_calls)
+    application = app.build_application(REPLAY_TOKEN, request=request)
+    timings = instrument_handlers(application)
+
+    await application.initialize()
+    try:
+        previous_t = None
+        previous_started = time.monotonic()
+
+        for event in events:
+            # إعادة تشغيل البوت في الإنتاج: تضيع الجلسات المحفوظة في الذاكرة ولا يُنتظر زمن التوقف
+            if event['kind'] == 'start':
+                application.bot_data.clear()
+                previous_t = None
+                continue
+
+            if speed == 'original' and previous_t is not None:
+                gap = min(event['t'] - previous_t, MAX_REPLAY_GAP)
+                delay = gap - (time.monotonic() - previous_started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            previous_t = event['t']
+            previous_started = time.monotonic()
+
+            update = Update.de_json(event['data'], application.bot)
+            await application.process_update(update)
+    finally:
+        await application.shutdown()
+
+    return diff_calls(recorded_calls, request.calls, ignore_params), timings
+
+
+def print_report(diff, timings):
+    """طباعة الفروقات وأزمنة الـ handlers"""
+    print("⏱️ أزمنة الـ handlers:")
+    print(f"{'handler':<24}{'calls':>7}{'total ms':>12}{'mean ms':>10}{'max ms':>10}")
+    for name, values in sorted(timings.items(), key=lambda item: -sum(item[1])):
+        total = sum(values) * 1000
+        print(f"{name:<24}{len(values):>7}{total:>12.2f}{total / len(values):>10.2f}{max(values) * 1000:>10.2f}")
+
+    if diff:
+        print("\n❌ الاستدعاءات الصادرة تختلف عن المسجلة:")
+        for line in diff:
+            print(line)
+    else:
+        print("\n✅ الاستدعاءات الصادرة مطابقة للمسجلة")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="إعادة تشغيل جلسة مسجلة للبوت")
+    parser.add_argument('session', help="ملف الجلسة (RECORD_SESSION_FILE)")
+    parser.add_argument('--speed', choices=['original', 'fast'], default='fast',
+                        help="original: بنفس توقيت التسجيل، fast: بأسرع ما يمكن")
+    parser.add_argument('--ignore-param', action='append', default=[],
+                        help="معامل يتم تجاهله في المقارنة (يمكن تكراره)")
+    args = parser.parse_args()
+
+    diff, timings = asyncio.run(replay_session(args.session, args.speed, args.ignore_param))
+    print_report(diff, timings)
+    sys.exit(1 if diff else 0)
+
+
+if __name__ == '__main__':
+    main()